@@ -2,82 +2,155 @@
 
 import sys
 import os
+import asyncio
 import concurrent.futures
+import contextlib
+import functools
+import threading
 import time
+from collections import Counter
+import requests
+from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from utils import config, logger, env, args
-from media.movieFolder import MovieFolder
+from utils import config, logger, env, args, scanState, state, __appName__, __version__
+from media.movieFolder import MovieFolder, folder_signature, has_local_trailer
 from providers.tmdb import Tmdb
 from providers.apple import Apple
 from downloaders.downloader import Downloader
 
 log = logger.get_log('TrailerTech')
+MAX_CONCURRENT_MOVIES = 32
+SCAN_QUEUE_SIZE = 64
+HEDGED_LINKS = 3
 
 class TrailerTech():
     def __init__(self):
-        self.directoriesScanned = 0
+        self._statsLock = threading.Lock()
+        self.stats = Counter()
         self.trailersDownloaded = []
-        self.trailersFound = 0
         self.startTime = time.perf_counter()
-        self.tmdb = Tmdb(config.min_resolution, config.max_resolution, config.languages, config.tmdb_API_key)
-        self.apple = Apple(config.min_resolution, config.max_resolution)
-        self.downloader = Downloader()
+        self.session = self._createSession()
+        self.tmdb = Tmdb(config.min_resolution, config.max_resolution, config.languages, config.tmdb_API_key, session=self.session)
+        self.apple = Apple(config.min_resolution, config.max_resolution, session=self.session)
+        self.downloader = Downloader(session=self.session)
+
+    def _createSession(self):
+        # One pooled session shared by every provider so connections are reused across movies
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=Retry(total=3, backoff_factor=0.3))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = '{}/{}'.format(__appName__, __version__)
+        return session
+
+    def _recordStat(self, name):
+        with self._statsLock:
+            self.stats[name] += 1
+
+    def _recordDownload(self, trailerName):
+        with self._statsLock:
+            self.trailersDownloaded.append(trailerName)
 
     def printStats(self):
         secondsElapsed = time.perf_counter() - self.startTime
-        missingTrailers = self.directoriesScanned - (len(self.trailersDownloaded) + self.trailersFound)
+        with self._statsLock:
+            directoriesScanned = self.stats['scanned']
+            trailersFound = self.stats['found']
+            trailersDownloaded = list(self.trailersDownloaded)
+        missingTrailers = directoriesScanned - (len(trailersDownloaded) + trailersFound)
         statsStr = '''
            TrailerTech Stats:
            Movie Directories Scanned: {}
            Trailers Downloaded:       {}
            Missing Trailers:          {}
            Completed In:              {}s
-        '''.format(self.directoriesScanned, len(self.trailersDownloaded), missingTrailers, int(secondsElapsed))
-        if len(self.trailersDownloaded) > 0:
+        '''.format(directoriesScanned, len(trailersDownloaded), missingTrailers, int(secondsElapsed))
+        if len(trailersDownloaded) > 0:
             statsStr += '\nNew Trailers:\n'
-        for trailer in self.trailersDownloaded:
+        for trailer in trailersDownloaded:
             statsStr += '{}\n'.format(trailer)
         
         print(statsStr)
 
-    def get_Trailer(self, movieDir, tmdbid=None, imdbid=None, title=None, year=None):
+    async def _run(self, func, *args, **kwargs):
+        # Run blocking provider, downloader and ffprobe calls off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def _shouldRescan(self, movieDir):
+        try:
+            signature = folder_signature(movieDir)
+        except OSError:
+            return True
+        return scanState.shouldRescan(movieDir, signature)
+
+    async def _setStatus(self, movieDir, status):
+        # The signature is taken after any download so the new trailer is part of it
+        try:
+            signature = await self._run(folder_signature, movieDir)
+        except OSError:
+            return
+        scanState.setStatus(movieDir, status, signature)
+
+    async def _none(self):
+        return None
+
+    async def get_Trailer(self, movieDir, tmdbid=None, imdbid=None, title=None, year=None):
         links = []
         # Check for invalid directory
-        if not os.path.isdir(os.path.abspath(movieDir)):
-            log.warning('Skipping. Invalid path: {}'.format(movieDir))
+        if not os.path.isdir(movieDir):
+            log.warning('Skipping. Invalid path: %s', movieDir)
+            return
+
+        # skip the full folder scan if a trailer is already named as one
+        if not args.deleteCorrupt and await self._run(has_local_trailer, movieDir):
+            log.debug('Skipping. Local trailer found in: %s', movieDir)
+            self._recordStat('scanned')
+            self._recordStat('found')
+            await self._setStatus(movieDir, state.FOUND)
             return
 
         # Parse movie folder. skip if no movies found
-        folder = MovieFolder(movieDir, deleteCorruptTrailer=args.deleteCorrupt)
+        folder = await self._run(MovieFolder, movieDir, deleteCorruptTrailer=args.deleteCorrupt, skipFFprobe=config.skip_ffprobe)
         if not folder.hasMovie:
-            log.warning('Skipping. Unable to determine Movie file in: {}'.format(movieDir))
+            log.warning('Skipping. Unable to determine Movie file in: %s', movieDir)
             return
 
-        self.directoriesScanned += 1
+        self._recordStat('scanned')
         
         # skip if trailer already exists
         if folder.hasTrailer:
-            log.debug('Skipping. Local trailer found: {}'.format(folder.trailer.path))
-            self.trailersFound += 1
+            log.debug('Skipping. Local trailer found: %s', folder.trailer.path)
+            self._recordStat('found')
+            await self._setStatus(movieDir, state.FOUND)
             return
 
         # If user provided data parse that info
         if (tmdbid or imdbid) or (title and year):
-            if self.tmdb.get_movie_details(tmdbid, imdbid, title, year):
+            details = await self._run(self.tmdb.get_movie_details, tmdbid, imdbid, title, year)
+            if details:
                 if config.apple_enabled:
-                    links.extend(self.apple.getLinks(self.tmdb.title, self.tmdb.year))
+                    links.extend(await self._run(self.apple.getLinks, self.tmdb.getTitle(details), self.tmdb.getYear(details)))
                 if config.youtube_enabled:
-                    links.extend(self.tmdb.getLinks())
+                    links.extend(self.tmdb.getLinks(details))
             else:
+                await self._setStatus(movieDir, state.MISSING)
                 return
         
         # Otherwise use movie folder data
         else:
-            if config.apple_enabled:
-                links.extend(self.apple.getLinks(folder.title, folder.year))
-            if config.youtube_enabled:
-                if self.tmdb.get_movie_details(folder.tmdb, folder.imdb, folder.title, folder.year):
-                    links.extend(self.tmdb.getLinks())
+            # Apple and TMDB only need the folder data so query them at the same time
+            appleLinks, details = await asyncio.gather(
+                self._run(self.apple.getLinks, folder.title, folder.year) if config.apple_enabled else self._none(),
+                self._run(self.tmdb.get_movie_details, folder.tmdb, folder.imdb, folder.title, folder.year) if config.youtube_enabled else self._none()
+            )
+            if appleLinks:
+                links.extend(appleLinks)
+            if details:
+                links.extend(self.tmdb.getLinks(details))
 
         # sort by source; reverse=True = prefer youtube-dl
         links.sort(reverse=config.perferred_source == 'youtube', key=lambda link: link['source'])
@@ -86,40 +159,89 @@ class TrailerTech():
         links.sort(reverse=True, key=lambda link: link['height'])
 
 
-        log.debug('Found {} trailer Links for "{}" ({}).'.format(len(links), folder.title, folder.year))
+        log.debug('Found %s trailer Links for "%s" (%s).', len(links), folder.title, folder.year)
         for link in links:
-            log.debug('Source: {}, Size: {}, link: {}'.format(link['source'], link['height'], link['url']))
+            log.debug('Source: %s, Size: %s, link: %s', link['source'], link['height'], link['url'])
 
-        # send them to the downloader
-        for link in links:
-            if self.downloader.download(folder.trailerName, folder.trailerDirectory, link['url']):
-                self.trailersDownloaded.append(folder.trailerName)
-                return
-        
-        log.info('No local or downloadable trailers for "{}" ({})'.format(folder.title, folder.year))
+        # send them to the downloader in batches, checking every link of a batch at once so slow or dead
+        # hosts cost one timeout instead of one per link
+        for i in range(0, len(links), HEDGED_LINKS):
+            batch = links[i:i + HEDGED_LINKS]
+            checks = [asyncio.ensure_future(self._run(self.downloader.isAvailable, link['url'])) for link in batch]
+            try:
+                # Walk the batch in preference order, downloading as soon as the best remaining link answers
+                for link, check in zip(batch, checks):
+                    if not await check:
+                        continue
+                    if await self._run(self.downloader.download, folder.trailerName, folder.trailerDirectory, link['url']):
+                        self._recordDownload(folder.trailerName)
+                        await self._setStatus(movieDir, state.DOWNLOADED)
+                        return
+            finally:
+                for check in checks:
+                    check.cancel()
+
+        log.info('No local or downloadable trailers for "%s" (%s)', folder.title, folder.year)
+        await self._setStatus(movieDir, state.MISSING)
 
     def scanLibrary(self, directory):
         libraryDir = os.path.abspath(directory)
         if not os.path.isdir(libraryDir):
-            log.critical('"{}" is not a valid path. Exiting.'.format(libraryDir))
+            log.critical('"%s" is not a valid path. Exiting.', libraryDir)
             return
 
-        for item in os.listdir(libraryDir):
-            path = os.path.abspath(os.path.join(libraryDir, item))
-            if os.path.isdir(path):
-                log.info('Scanning: {}'.format(path))
-                self.get_Trailer(path)
+        asyncio.run(self._scanAsync(libraryDir, workers=1))
 
     def scanLibraryThreaded(self, directory):
         libraryDir = os.path.abspath(directory)
         if not os.path.isdir(libraryDir):
-            log.critical('"{}" is not a valid path. Exiting.'.format(libraryDir))
+            log.critical('"%s" is not a valid path. Exiting.', libraryDir)
             return
-        log.info('Building list of directories to scan for trailers.')
-        movieDirs = [os.path.join(libraryDir, subDir) for subDir in os.listdir(libraryDir) if os.path.isdir(os.path.join(libraryDir, subDir))]
-        log.info('Initiating scan on {} movie directories.'.format(len(movieDirs)))
-        with concurrent.futures.ThreadPoolExecutor(max_workers=None) as executer:
-            executer.map(self.get_Trailer, movieDirs)
+        log.info('Initiating scan on movie directories in %s with %s workers.', libraryDir, MAX_CONCURRENT_MOVIES)
+        asyncio.run(self._scanAsync(libraryDir, workers=MAX_CONCURRENT_MOVIES))
+
+    async def _scanAsync(self, libraryDir, workers):
+        # Size the executor so every worker can run its parallel lookups and link checks at once;
+        # the loop's default executor is capped at min(32, cpu_count + 4) threads
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers * HEDGED_LINKS)
+        asyncio.get_running_loop().set_default_executor(executor)
+
+        # Directories are streamed through a bounded queue so downloads start while the library is still being listed
+        queue = asyncio.Queue(maxsize=SCAN_QUEUE_SIZE)
+        showProgress = not args.quiet and sys.stderr.isatty()
+        # Route console logging through tqdm while the bar is shown so log lines don't break it
+        redirect = logging_redirect_tqdm(loggers=logger.loggers) if showProgress else contextlib.nullcontext()
+        with redirect, tqdm(desc='Scanning', unit='movie', disable=not showProgress) as progress:
+            consumers = [self._consumeDirectories(queue, progress) for _ in range(workers)]
+            await asyncio.gather(self._produceDirectories(libraryDir, queue, workers), *consumers)
+
+    async def _produceDirectories(self, libraryDir, queue, workers):
+        for entry in os.scandir(libraryDir):
+            if entry.is_dir():
+                # Leave out directories that already got a trailer on a previous run.
+                # --delete_corrupt needs to revisit them to check the existing trailers
+                if not (args.force or args.deleteCorrupt) and not await self._run(self._shouldRescan, entry.path):
+                    log.debug('Skipping. Trailer handled on a previous run: %s', entry.path)
+                    continue
+                # entry.path is already absolute because libraryDir is
+                await queue.put(entry.path)
+
+        # One sentinel per worker signals the end of the library
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _consumeDirectories(self, queue, progress):
+        while True:
+            movieDir = await queue.get()
+            if movieDir is None:
+                break
+            log.info('Scanning: %s', movieDir)
+            try:
+                await self.get_Trailer(movieDir)
+            except Exception as e:
+                log.error('Failed to process %s ERROR: %s', movieDir, e)
+                await self._setStatus(movieDir, state.ERROR)
+            progress.update(1)
 
     def main(self):
         log.info('Starting TrailerTech')
@@ -131,15 +253,15 @@ class TrailerTech():
             if args.recursive:
                 # Parse entire library
                 if args.threads:
-                    log.info('Parsing "{}" in recursive mode. Threads enabled.'.format(args.directory))
+                    log.info('Parsing "%s" in recursive mode. Threads enabled.', args.directory)
                     self.scanLibraryThreaded(args.directory)
                 else:
-                    log.info('Parsing "{}" in recursive mode.'.format(args.directory))
+                    log.info('Parsing "%s" in recursive mode.', args.directory)
                     self.scanLibrary(args.directory)
             else:
                 # Parse single movie directory
-                log.info('Parsing "{}" in single movie mode.'.format(args.directory))
-                self.get_Trailer(args.directory, args.tmdb, args.imdb, args.title, args.year)
+                log.info('Parsing "%s" in single movie mode.', args.directory)
+                asyncio.run(self.get_Trailer(args.directory, args.tmdb, args.imdb, args.title, args.year))
 
             # Cleanup the temp download directory
             log.info('Cleaning up temp directory.')
@@ -147,19 +269,19 @@ class TrailerTech():
 
         # Check environment variables
         elif env.event == 'download' and env.movieDirectory:
-            log.info('Called from Radarr Parsing "{}"'.format(env.movieDirectory))
-            self.get_Trailer(env.movieDirectory, env.tmdbid, env.imdbid, env.movieTitle, env.year)
+            log.info('Called from Radarr Parsing "%s"', env.movieDirectory)
+            asyncio.run(self.get_Trailer(env.movieDirectory, env.tmdbid, env.imdbid, env.movieTitle, env.year))
 
             # Cleanup the temp download directory
             log.info('Cleaning up temp directory.')
             self.downloader.cleanUp()
 
         elif env.event == 'test':
-            log.info('Radarr called with event: {}'.format(env.event))
+            log.info('Radarr called with event: %s', env.event)
             sys.exit(0)
 
         elif env.event:
-            log.info('Exiting. Radarr called with unsupported EVENT: {}'.format(env.event))
+            log.info('Exiting. Radarr called with unsupported EVENT: %s', env.event)
             sys.exit(0)
 
         else:
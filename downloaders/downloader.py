@@ -9,9 +9,12 @@ from utils import logger
 from downloaders import DL_DIRECTORY
 
 log = logger.get_log(__name__)
+APPLE_HEADERS = {'User-Agent': 'Quick_time/7.6.2'}
+MIN_DOWNLOAD_SIZE = 1000000  # In bytes
 
 class Downloader():
-    def __init__(self):
+    def __init__(self, session=None):
+        self.session = session or requests.Session()
         self._createTempDir()
 
     def cleanUp(self):
@@ -83,12 +86,11 @@ class Downloader():
         log.info('Attempting to download video at "{}". Please Wait...'.format(link))
         tempPath = os.path.join(DL_DIRECTORY, fileName)
         destinationPath = os.path.join(destinationDirectory, fileName)
-        headers = {'User-Agent': 'Quick_time/7.6.2'}
 
         try:
-            with requests.get(link, stream=True, headers=headers, timeout=5) as response:
+            with self.session.get(link, stream=True, headers=APPLE_HEADERS, timeout=5) as response:
                 response.raise_for_status()
-                if int(response.headers.get('Content-length')) < 1000000:
+                if int(response.headers.get('Content-length')) < MIN_DOWNLOAD_SIZE:
                     log.warning('File too small. URL: {} Content-Length: {}'.format(link, response.headers.get('Content-Length')))
                     return False
                 with open(tempPath, 'wb') as tempFile:
@@ -102,10 +104,28 @@ class Downloader():
             log.warning('Encountered an error while writing to disk. File: {} ERROR: {}'.format(tempPath, e))
             return False
 
-        if self._moveTo(tempPath, destinationPath):
-            self.cleanUp()
+        return self._moveTo(tempPath, destinationPath)
+
+    def isAvailable(self, link):
+        # Only direct Apple links can be checked cheaply, youtube-dl links are assumed reachable
+        if not 'apple' in link.lower():
             return True
 
+        try:
+            with self.session.head(link, headers=APPLE_HEADERS, timeout=5, allow_redirects=True) as response:
+                response.raise_for_status()
+                contentLength = response.headers.get('Content-Length')
+                if contentLength and int(contentLength) < MIN_DOWNLOAD_SIZE:
+                    log.debug('File too small. URL: {} Content-Length: {}'.format(link, contentLength))
+                    return False
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            log.debug('Trailer not reachable at {} ERROR: {}'.format(link, e))
+            return False
+        except requests.exceptions.RequestException as e:
+            # Some hosts reject HEAD (403/405/501) but still serve GET, so let the download decide
+            log.debug('Could not check {} ERROR: {}'.format(link, e))
+        return True
+
     def download(self, fileName, destinationDirectory, link):
         if 'apple' in link.lower():
             return self.downloadApple(fileName, destinationDirectory, link)
@@ -1,30 +1,76 @@
 #!/usr/bin/env python3
 
 import os
-import json
+import concurrent.futures
 import subprocess
 import re
 from datetime import datetime
-from utils import logger
+from functools import cached_property
+from utils import logger, diskCache, CACHE_TTL
 try:
     import xml.etree.cElementTree as et
 except ImportError:
     import xml.etree.ElementTree as et
+try:
+    import orjson as json
+except ImportError:
+    import json
 
 MIN_MOVIE_DURATION = 600  # In seconds
 MIN_TRAILER_SIZE = 500000  # In bytes
-VIDEO_EXTENSIONS = ['.mkv', '.iso', '.wmv', '.avi', '.mp4', '.m4v', '.img', '.divx', '.mov', '.flv', '.m2ts', '.ts']
-NFO_EXTENSIONS = ['.nfo', '.xml']
-ID_TAGS = ['imdb', 'tmdb', 'imdbid', 'tmdbid', 'tmdb_id', 'imdb_id', 'id']
+MIN_MOVIE_SIZE = 400 * 1024 * 1024  # In bytes
+VIDEO_EXTENSIONS = frozenset(['.mkv', '.iso', '.wmv', '.avi', '.mp4', '.m4v', '.img', '.divx', '.mov', '.flv', '.m2ts', '.ts'])
+NFO_EXTENSIONS = frozenset(['.nfo', '.xml'])
+ID_TAGS = frozenset(['imdb', 'tmdb', 'imdbid', 'tmdbid', 'tmdb_id', 'imdb_id', 'id'])
 IMDB_ID_PATTERN = re.compile(r'ev\d{7,8}\/\d{4}(-\d)?|(ch|co|ev|nm|tt)\d{7,8}', flags=re.IGNORECASE)
 TMDB_ID_PATTERN = re.compile(r'[1-9]\d{1,10}')
 YEAR_PATTERN = re.compile(r'\d{4}')
+FFPROBE_DURATION_ARGS = ['ffprobe', '-v', 'fatal', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1']
 
 log = logger.get_log(__name__)
 
+def has_local_trailer(directory):
+    '''
+    Checks for a "-trailer" video next to an obvious movie file using only the directory listing.
+    Folders where either is unclear are left for the full scan.
+    '''
+    hasTrailer = hasMovie = False
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                if not ext.lower() in VIDEO_EXTENSIONS or not entry.is_file():
+                    continue
+                if name.lower().endswith('-trailer'):
+                    hasTrailer = True
+                elif entry.stat().st_size > MIN_MOVIE_SIZE:
+                    hasMovie = True
+                if hasTrailer and hasMovie:
+                    return True
+    except OSError:
+        return False
+    return False
+
+def folder_signature(directory):
+    '''
+    Summarizes the listing and modification times of a movie folder, including BluRay and DVD
+    subfolders, so later runs can tell whether anything changed. Raises OSError if it cannot be read.
+    '''
+    listing = sorted(os.listdir(directory))
+    signature = [os.stat(directory).st_mtime_ns, tuple(listing)]
+
+    # BluRay and DVD folders keep the movie and trailer one level down
+    for name in listing:
+        if 'bdmv' in name.lower() or 'video_ts' in name.lower():
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                signature.append((name, os.stat(path).st_mtime_ns, tuple(sorted(os.listdir(path)))))
+    return tuple(signature)
+
 class File():
-    def __init__(self, path):
+    def __init__(self, path, entry=None):
         self.path = path
+        self._entry = entry
 
     @property
     def fileName(self):
@@ -32,6 +78,9 @@ class File():
 
     @property
     def fileSize(self):
+        # os.DirEntry caches its stat result, so prefer it when the file came from a scandir
+        if self._entry:
+            return self._entry.stat().st_size
         return os.path.getsize(self.path)
 
     def delete(self):
@@ -41,13 +90,20 @@ class File():
             pass
 
 class Video(File):
-    def __init__(self, path):
-        super().__init__(path)
+    def __init__(self, path, skipFFprobe=False, entry=None):
+        super().__init__(path, entry)
+        self.skipFFprobe = skipFFprobe
+        self._probed = False
+        self.duration = self._estimateDuration()
+
+    @property
+    def needsProbe(self):
+        return self.duration is None and not self._probed and not self.skipFFprobe
 
     @property
     def isCorrupt(self):
         # skip if file not supported
-        if os.path.splitext(self.fileName)[-1] in ['.iso']:
+        if os.path.splitext(self.fileName)[-1].lower() == '.iso':
             return False
 
         # if file is too small assume its corrupt
@@ -61,7 +117,7 @@ class Video(File):
             stdout=subprocess.PIPE
             )
 
-        videoDetails = json.loads(result.stdout.decode())
+        videoDetails = json.loads(result.stdout)
         returnCode = result.returncode
         if returnCode != 0:
             return True
@@ -80,12 +136,14 @@ class Video(File):
 
     @property
     def isMovie(self):
-        if os.path.splitext(self.fileName)[0].endswith('-trailer'):
+        if os.path.splitext(self.fileName)[0].lower().endswith('-trailer'):
             return False
 
-        duration = self.get_duration()
-        if not duration is None:
-            if duration >= MIN_MOVIE_DURATION:
+        if self.needsProbe:
+            self.probe()
+
+        if not self.duration is None:
+            if self.duration >= MIN_MOVIE_DURATION:
                 return True
             else:
                 # video is less than min_movie_duration and does not include -trailer in its filename
@@ -94,12 +152,20 @@ class Video(File):
             # Unable to determine duration assume its the movie since it doesn't have -trailer in file name
             return True
 
+    def _estimateDuration(self):
+        # Naming and size conventions settle most files without spawning ffprobe
+        if os.path.splitext(self.fileName)[0].lower().endswith('-trailer'):
+            return MIN_MOVIE_DURATION - 1
+        try:
+            if self.fileSize > MIN_MOVIE_SIZE:
+                return MIN_MOVIE_DURATION + 1
+        except OSError:
+            pass
+        return None
+
     def get_duration(self):
-        result = subprocess.run([
-            'ffprobe', '-v', 'fatal', '-show_entries',
-            'format=duration', '-of',
-            'default=noprint_wrappers=1:nokey=1',
-            self.path],
+        result = subprocess.run(
+            FFPROBE_DURATION_ARGS + [self.path],
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT
             )
@@ -108,9 +174,13 @@ class Video(File):
         except ValueError:
             return None
 
+    def probe(self):
+        self.duration = self.get_duration()
+        self._probed = True
+
 class NFO(File):
-    def __init__(self, path):
-        super().__init__(path)
+    def __init__(self, path, entry=None):
+        super().__init__(path, entry)
         self.__originaltitle = None
         self.__title = None
         self.__localtitle = None
@@ -125,7 +195,7 @@ class NFO(File):
         self.__id = None
         self.__parse_nfo()
 
-    @property
+    @cached_property
     def is_complete(self):
         if self.imdb or self.tmdb:
             return True
@@ -134,7 +204,7 @@ class NFO(File):
         else:
             return False
 
-    @property
+    @cached_property
     def title(self):
         if isinstance(self.__originaltitle, str):
             return self.__originaltitle
@@ -145,90 +215,131 @@ class NFO(File):
         else:
             return None
 
-    @property
+    @cached_property
     def year(self):
         if self.__premiered:
             year = self.__parse_releaseDate(self.__premiered)
-            match = re.match(YEAR_PATTERN, year)
+            match = YEAR_PATTERN.match(year)
             if match:
                 return year
         
         if self.__releasedate:
-            year = self.__parse_releaseDate(self.__parse_releaseDate)
-            match = re.match(YEAR_PATTERN, year)
+            year = self.__parse_releaseDate(self.__releasedate)
+            match = YEAR_PATTERN.match(year)
             if match:
                 return year
         
         if self.__year:
-            match = re.match(YEAR_PATTERN, self.__year)
+            match = YEAR_PATTERN.match(self.__year)
             if match:
                 return self.__year
 
         if self.__productionyear:
-            match = re.match(YEAR_PATTERN, self.__productionyear)
+            match = YEAR_PATTERN.match(self.__productionyear)
             if match:
                 return self.__productionyear
 
         return None
 
-    @property
+    @cached_property
     def imdb(self):
-        if self.__unique_id_imdb and re.match(IMDB_ID_PATTERN, self.__unique_id_imdb):
+        if self.__unique_id_imdb and IMDB_ID_PATTERN.match(self.__unique_id_imdb):
             return self.__unique_id_imdb
-        if self.__imdb and re.match(IMDB_ID_PATTERN, self.__imdb):
+        if self.__imdb and IMDB_ID_PATTERN.match(self.__imdb):
             return self.__imdb
-        if self.__id and re.match(IMDB_ID_PATTERN, self.__id):
+        if self.__id and IMDB_ID_PATTERN.match(self.__id):
             return self.__id
         return None
 
-    @property
+    @cached_property
     def tmdb(self):
-        if self.__unique_id_tmdb and re.match(TMDB_ID_PATTERN, self.__unique_id_tmdb):
+        if self.__unique_id_tmdb and TMDB_ID_PATTERN.match(self.__unique_id_tmdb):
             return self.__unique_id_tmdb
-        if self.__tmdb and re.match(TMDB_ID_PATTERN, self.__tmdb):
+        if self.__tmdb and TMDB_ID_PATTERN.match(self.__tmdb):
             return self.__tmdb
-        if self.__id and re.match(TMDB_ID_PATTERN, self.__id):
+        if self.__id and TMDB_ID_PATTERN.match(self.__id):
             return self.__id
         return None
 
     def __parse_nfo(self):
+        # Stream the file so large <fileinfo>/<actor> blocks are never held in memory
+        depth = 0
         try:
-            nfo = et.parse(self.path)
-            root  = nfo.getroot()
+            for event, item in et.iterparse(self.path, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+
+                # Only direct children of the root element carry movie data
+                if depth != 1:
+                    continue
+                handler = self.__TAG_HANDLERS.get(item.tag.lower())
+                if handler:
+                    handler(self, item)
+                item.clear()
+
+                # Stop once the highest priority title, year and ids have been read and pass validation
+                if self.__has_preferred_fields():
+                    break
         except (IOError, et.ParseError) as e:
-            log.debug('Failed to parse NFO: {} ERROR: {}'.format(self.fileName, e))
+            log.debug('Failed to parse NFO: %s ERROR: %s', self.fileName, e)
             return
 
-
-        for item in root:
-            # Parse uniqueid
-            if item.tag.lower() == 'uniqueid':
-                if item.attrib['type'].lower() == 'tmdb':
-                    self.__unique_id_tmdb = item.text
-                elif item.attrib['type'].lower() == 'imdb':
-                    self.__unique_id_imdb = item.text
-            
-            # Parse additional ids
-            elif item.tag.lower() in ID_TAGS:
-                self.__parse_id(item.text)
-            
-            # Parse release years
-            elif item.tag.lower() == 'premiered':
-                self.__premiered = self.__parse_releaseDate(item.text)
-            elif item.tag.lower() == 'release_date':
-                self.__releasedate = self.__parse_releaseDate(item.text)
-            elif item.tag.lower() == 'year':
-                self.__year = item.text
-            elif item.tag.lower() == 'productionyear':
-                self.__productionyear = item.text
-
-            # Parse titles
-            elif item.tag.lower() == 'title':
-                self.__title = item.text
-            elif item.tag.lower() == 'originaltitle':
-                self.__originaltitle = item.text
-            elif item.tag.lower() == 'localtitle':
-                self.__localtitle = item.text
+    def __has_preferred_fields(self):
+        # Mirrors the checks in the title/year/imdb/tmdb properties so no later tag can outrank these values
+        return (isinstance(self.__originaltitle, str)
+            and bool(self.__premiered and YEAR_PATTERN.match(self.__premiered))
+            and bool(self.__unique_id_tmdb and TMDB_ID_PATTERN.match(self.__unique_id_tmdb))
+            and bool(self.__unique_id_imdb and IMDB_ID_PATTERN.match(self.__unique_id_imdb)))
+
+    # Parse uniqueid
+    def __handle_uniqueid(self, item):
+        idType = item.attrib.get('type', '').lower()
+        if idType == 'tmdb':
+            self.__unique_id_tmdb = item.text
+        elif idType == 'imdb':
+            self.__unique_id_imdb = item.text
+
+    # Parse additional ids
+    def __handle_id(self, item):
+        self.__parse_id(item.text)
+
+    # Parse release years
+    def __handle_premiered(self, item):
+        self.__premiered = self.__parse_releaseDate(item.text)
+
+    def __handle_releasedate(self, item):
+        self.__releasedate = self.__parse_releaseDate(item.text)
+
+    def __handle_year(self, item):
+        self.__year = item.text
+
+    def __handle_productionyear(self, item):
+        self.__productionyear = item.text
+
+    # Parse titles
+    def __handle_title(self, item):
+        self.__title = item.text
+
+    def __handle_originaltitle(self, item):
+        self.__originaltitle = item.text
+
+    def __handle_localtitle(self, item):
+        self.__localtitle = item.text
+
+    # Lowercase tag name -> handler, built once when the class is created
+    __TAG_HANDLERS = {
+        'uniqueid': __handle_uniqueid,
+        **dict.fromkeys(ID_TAGS, __handle_id),
+        'premiered': __handle_premiered,
+        'release_date': __handle_releasedate,
+        'year': __handle_year,
+        'productionyear': __handle_productionyear,
+        'title': __handle_title,
+        'originaltitle': __handle_originaltitle,
+        'localtitle': __handle_localtitle,
+    }
 
     def __parse_releaseDate(self, releaseDate):
         if releaseDate:
@@ -251,12 +362,19 @@ class NFO(File):
         return None
 
 class MovieFolder():
-    def __init__(self, directory, deleteCorruptTrailer=False):
+    _cache = diskCache
+
+    def __init__(self, directory, deleteCorruptTrailer=False, skipFFprobe=False):
         self.deleteCorruptTrailer = deleteCorruptTrailer
+        self.skipFFprobe = skipFFprobe
         self.rootDir = os.path.abspath(directory)
         self.movie = None
         self.trailer = None
         self._nfo = None
+        self.hasMovie = False
+        self.hasTrailer = False
+        self.trailerName = None
+        self.trailerDirectory = None
         self.scan()
 
     @property
@@ -289,103 +407,132 @@ class MovieFolder():
             return self._parseIMDBFromMovieFile()
         return None
 
-    @property
-    def trailerName(self):
-        if self.hasMovie:
-            return os.path.splitext(self.movie.fileName)[0] + '-trailer.mp4'
-
-    @property
-    def trailerDirectory(self):
-        if self.hasMovie:
-            return os.path.dirname(self.movie.path)
-
-    @property
-    def hasTrailer(self):
-        return not self.trailer == None
-
-    @property
-    def hasMovie(self):
-        return not self.movie == None
-
     def _parseTitleFromFolder(self):
         title = os.path.basename(self.rootDir).split('(')[0].strip()
-        log.debug('Parsed title from folder: {}'.format(title)) 
+        log.debug('Parsed title from folder: %s', title)
         return title
 
     def _parseYearFromFolder(self):
         year = os.path.basename(self.rootDir).split('(')[-1].replace('(', '').replace(')', '').strip()
-        log.debug('Parsed year from folder: {}'.format(year))
-        match = re.match(YEAR_PATTERN, year)
+        log.debug('Parsed year from folder: %s', year)
+        match = YEAR_PATTERN.match(year)
         if match:
             return year
         return None
 
     def _parseIMDBFromMovieFile(self):
         if self.movie:
-            match = re.search(IMDB_ID_PATTERN, self.movie.path)
+            match = IMDB_ID_PATTERN.search(self.movie.path)
             if match:
                 imdb = match.group(0)
-                log.debug('Parsed IMDB from movie file name: {}'.format(imdb))
+                log.debug('Parsed IMDB from movie file name: %s', imdb)
                 return imdb
         return None
 
+    def _signature(self):
+        return folder_signature(self.rootDir)
+
     def scan(self):
+        cacheKey = 'MovieFolder:{}'.format(self.rootDir)
+
+        # Reuse the previous results if nothing in the folder has changed
+        if not self.deleteCorruptTrailer:
+            cached = self._cache.get(cacheKey)
+            if cached and cached[0] == self._signature() and all(os.path.isfile(path) for path in cached[1:] if path):
+                _, moviePath, trailerPath, nfoPath = cached
+                self.movie = Video(moviePath) if moviePath else None
+                self.trailer = Video(trailerPath) if trailerPath else None
+                self._nfo = NFO(nfoPath) if nfoPath else None
+                log.debug('Loaded cached scan of %s', self.rootDir)
+                self._setScanResults()
+                return
+
+        self._scanDirectory()
+        self._cache.set(cacheKey, (
+            self._signature(),
+            self.movie.path if self.movie else None,
+            self.trailer.path if self.trailer else None,
+            self._nfo.path if self._nfo else None
+            ), ttl=CACHE_TTL)
+        self._setScanResults()
+
+    def _setScanResults(self):
+        # Computed once per scan since these are read repeatedly while fetching a trailer
+        self.hasMovie = not self.movie == None
+        self.hasTrailer = not self.trailer == None
+        if self.hasMovie:
+            self.trailerName = os.path.splitext(self.movie.fileName)[0] + '-trailer.mp4'
+            self.trailerDirectory = os.path.dirname(self.movie.path)
+
+    def _probeDurations(self, videos):
+        # Run any ffprobe calls still needed concurrently rather than one after another
+        pending = [video for video in videos if video.needsProbe]
+        if len(pending) > 1:
+            workers = min(len(pending), (os.cpu_count() or 1) * 2)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(Video.probe, pending))
+
+    def _scanDirectory(self):
+        videos = []
         for item in os.scandir(self.rootDir):
-            if os.path.isfile(item.path):
-                ext = os.path.splitext(item.path)[-1].lower()
+            if item.is_file():
+                ext = os.path.splitext(item.name)[-1].lower()
                 if ext in VIDEO_EXTENSIONS:
-                    video = Video(item.path)
-                    isMovie = video.isMovie
-                    if isMovie:
-                        self.movie = video
-                        log.debug('Movie Found: {}'.format(self.movie.fileName))
-                    elif isMovie == False:
-                        if self.deleteCorruptTrailer and video.isCorrupt:
-                            log.warning('Deleting corrupt trailer {}'.format(self.trailer.fileName))
-                            video.delete()
-                        else:
-                            self.trailer = video
-                            log.debug('Trailer Found: {}'.format(self.trailer.fileName))
-                    elif isMovie == None:
-                        log.warning('Could not determine if video is movie or trailer: {}'.format(video.path))
+                    videos.append(Video(item.path, self.skipFFprobe, entry=item))
                 elif ext in NFO_EXTENSIONS:
-                    nfo = NFO(item.path)
+                    nfo = NFO(item.path, entry=item)
                     if (nfo.is_complete and not self._nfo) or (nfo.is_complete and nfo.fileSize > self._nfo.fileSize):
                         self._nfo = nfo
-                        log.debug('NFO Found: {}'.format(self._nfo.fileName))
+                        log.debug('NFO Found: %s', self._nfo.fileName)
             
-            elif os.path.isdir(item.path):
+            elif item.is_dir():
     
                 # Handle bdmv folders
-                if 'bdmv' in item.path.lower() and os.path.isdir(item.path):
-                    log.debug('Encountered a BluRay folder structure "{}"'.format(item.path))
+                if 'bdmv' in item.name.lower():
+                    log.debug('Encountered a BluRay folder structure "%s"', item.path)
                     bd_file = os.path.join(item.path, 'index.bdmv')
                     if os.path.isfile(bd_file):
                         video = Video(bd_file)
-                        log.debug('Movie Found: {}'.format(video.fileName))
+                        log.debug('Movie Found: %s', video.fileName)
                         self.movie = video
                         # Find the trailer in the BDMV folder
                         for entry in os.listdir(item.path):
                             path = os.path.join(item.path, entry)
-                            if os.path.isfile(path) and os.path.splitext(path)[-1] in VIDEO_EXTENSIONS:
-                                video = Video(path)
+                            if os.path.isfile(path) and os.path.splitext(path)[-1].lower() in VIDEO_EXTENSIONS:
+                                video = Video(path, self.skipFFprobe)
                                 if not video.isMovie:
-                                    log.debug('Found trailer: {}'.format(video.fileName))
+                                    log.debug('Found trailer: %s', video.fileName)
                                     self.trailer = video
                 
                 # Handle video_ts folders
-                elif 'video_ts' in item.path.lower() and os.path.isdir(item.path):
-                    log.debug('Encountered a DVD folder structure "{}"'.format(item.path))
+                elif 'video_ts' in item.name.lower():
+                    log.debug('Encountered a DVD folder structure "%s"', item.path)
                     dvd_file = os.path.join(item.path, 'VIDEO_TS.IFO')
                     if os.path.isfile(dvd_file):
                         video = Video(dvd_file)
-                        log.debug('Movie Found: {}'.format(video.fileName))
+                        log.debug('Movie Found: %s', video.fileName)
                         self.movie = video
                         # Find the trailer in the VIDEO_TS folder
                         for entry in os.listdir(item.path):
                             path = os.path.join(item.path, entry)
-                            if os.path.isfile(path) and os.path.splitext(path)[-1] in VIDEO_EXTENSIONS:
-                                video = Video(path)
+                            if os.path.isfile(path) and os.path.splitext(path)[-1].lower() in VIDEO_EXTENSIONS:
+                                video = Video(path, self.skipFFprobe)
                                 if not video.isMovie:
-                                    log.debug('Trailer Found: {}'.format(video.fileName))
+                                    log.debug('Trailer Found: %s', video.fileName)
                                     self.trailer = video
+
+        self._probeDurations(videos)
+        for video in videos:
+            isMovie = video.isMovie
+            if isMovie:
+                self.movie = video
+                log.debug('Movie Found: %s', self.movie.fileName)
+            elif isMovie == False:
+                if self.deleteCorruptTrailer and video.isCorrupt:
+                    log.warning('Deleting corrupt trailer %s', video.fileName)
+                    video.delete()
+                else:
+                    self.trailer = video
+                    log.debug('Trailer Found: %s', self.trailer.fileName)
+            elif isMovie == None:
+                log.warning('Could not determine if video is movie or trailer: %s', video.path)
@@ -2,17 +2,23 @@
 
 import requests
 import socket
-from utils import logger
+try:
+    import orjson as json
+except ImportError:
+    import json
+from utils import logger, disk_cached, CACHE_TTL
 
 moviePage_url = 'https://trailers.apple.com/'
 movieSearch_url = 'https://trailers.apple.com/trailers/home/scripts/quickfind.php'
 log = logger.get_log(__name__)
 
 class Apple():
-    def __init__(self, min_resolution, max_resolution):
+    def __init__(self, min_resolution, max_resolution, session=None):
         self.min_resolution = int(min_resolution)
         self.max_resolution = int(max_resolution)
+        self.session = session or requests.Session()
 
+    @disk_cached(ttl=CACHE_TTL)
     def _getMoivePage(self, title, year):
         movies = self._getJson(movieSearch_url, params={'q': title})
 
@@ -50,9 +56,9 @@ class Apple():
 
     def _getJson(self, url, params=None):
         try:
-            with requests.get(url, params=params, timeout=5) as r:
+            with self.session.get(url, params=params, timeout=5) as r:
                 r.raise_for_status()
-                result = r.json()
+                result = json.loads(r.content)
                 result['url'] = r.url
                 return result
         except ValueError:
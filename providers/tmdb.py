@@ -3,7 +3,7 @@
 import tmdbsimple as tmdb
 from requests import HTTPError
 from datetime import datetime
-from utils import logger
+from utils import logger, disk_cached, CACHE_TTL
 
 log = logger.get_log(__name__)
 YOUTUBE_BASE_URL = 'https://www.youtube.com/watch?v='
@@ -11,68 +11,61 @@ VIMEO_BASE_URL = 'https://vimeo.com/'
 TMDB_API = '28c936c57b653df80585b30667c1aa2d'
 
 class Tmdb(object):
-    def __init__(self, min_resolution, max_resolution, languages, api_key=None):
+    def __init__(self, min_resolution, max_resolution, languages, api_key=None, session=None):
         self.min_resolution = min_resolution
         self.max_resolution = max_resolution
         self.languages = languages
-        self.data = None
         if not api_key:
             tmdb.API_KEY = TMDB_API
         else:
             tmdb.API_KEY = api_key
+        if session:
+            tmdb.REQUESTS_SESSION = session
 
     @property
     def hasAPIkey(self):
         return not tmdb.API_KEY == None
 
-    @property
-    def title(self):
-        if not self.data:
+    def getTitle(self, data):
+        if not data:
             return None
 
-        if 'original_title' in self.data:
-            return self.data.get('original_title', None)
-        if 'title' in self.data:
-            return self.data.get('title', None)
+        if 'original_title' in data:
+            return data.get('original_title', None)
+        if 'title' in data:
+            return data.get('title', None)
         return None
 
-    @property
-    def year(self):
-        if not self.data:
+    def getYear(self, data):
+        if not data:
             return None
 
-        if 'release_date' in self.data:
+        if 'release_date' in data:
             try:
-                year = str(datetime.strptime(self.data['release_date'], '%Y-%m-%d').year)
+                year = str(datetime.strptime(data['release_date'], '%Y-%m-%d').year)
             except:
                 return None
             else:
                 return year
         return None
 
-    @property
-    def videos(self):
-        if self.data and 'videos' in self.data:
-            videos = self.data.get('videos', None)
+    def getVideos(self, data):
+        if data and 'videos' in data:
+            videos = data.get('videos', None)
             if 'results' in videos:
                 return videos.get('results', None)
         return None
 
-    @property
-    def has_videos(self):
-        if not self.videos == None:
-            return True
-        return False
-
-    def getLinks(self):
+    def getLinks(self, data):
         links = []
+        videos = self.getVideos(data)
 
         # return empty list if no movie details or videos exist
-        if not self.data or not self.videos:
+        if not data or not videos:
             return links
 
         # Filter videos 
-        for video in self.videos:
+        for video in videos:
             # Filter based on type
             if not video['type'].lower() == 'trailer':
                 log.debug('Filtered based on type. {}'.format(video['name']))
@@ -100,11 +93,12 @@ class Tmdb(object):
             links.append(trailer)
         return links
 
-    def get_trailer_links(self, languages=None, min_size=0):
+    def get_trailer_links(self, data, languages=None, min_size=0):
         trailers = []
-        if not self.videos:
+        videos = self.getVideos(data)
+        if not videos:
             return trailers
-        for video in self.videos:
+        for video in videos:
             # Filter based on type
             if not video['type'].lower() == 'trailer':
                 log.debug('Filtered based on type. {}'.format(video['name']))
@@ -130,6 +124,7 @@ class Tmdb(object):
             trailers.append(video)
         return [x['link'] for x in trailers]
 
+    @disk_cached(ttl=CACHE_TTL)
     def get_movie_details(self, tmdbid=None, imdbid=None, title=None, year=None):
         log.debug('Getting data from TMDB')
         if tmdbid:
@@ -147,11 +142,10 @@ class Tmdb(object):
             ))
             return None
         try:
-            self.data = movie.info(append_to_response='videos')
+            return movie.info(append_to_response='videos')
         except HTTPError as e:
             self._handle_error(e)
             return None
-        return True
 
     def __get_movie(self, tmdbid):
         try:
@@ -178,7 +172,6 @@ class Tmdb(object):
             return False
         except IndexError:
             log.warning('IMDB id not found: {}'.format(imdbid))
-            self.data = None
             return False
         
         return tmdb_id
@@ -191,7 +184,6 @@ class Tmdb(object):
             return False
         
         if not response['results'] or len(response['results']) < 1:
-            self.data = None
             return False
 
         for result in response['results']:
@@ -200,7 +192,6 @@ class Tmdb(object):
 
     def _handle_error(self, error):
         status_code = error.response.status_code
-        self.data = None
         if status_code == 401:
             log.error('TMDB API key was not accepted.')
         elif status_code == 404:
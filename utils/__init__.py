@@ -5,6 +5,8 @@ from utils.logger import Logger
 from utils.config import Config
 from utils.environment import Env
 from utils.arguments import get_arguments
+from utils.cache import DiskCache
+from utils.state import ScanState
 
 __appName__ = 'TrailerTech'
 __author__ = 'JsAddiction'
@@ -13,7 +15,13 @@ __description__ = 'Download Trailers for your movie library.'
 
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'settings.ini')
 LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'TrailerTech.log')
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache.db')
+CACHE_TTL = 60 * 60 * 24 * 7  # In seconds
+STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'state.db')
 env = Env()
 args = get_arguments(__appName__, __description__, __version__)
 config = Config(CONFIG_PATH)
 logger = Logger(LOG_PATH, config.log_level, config.log_to_file, quiet=args.quiet)
+diskCache = DiskCache(CACHE_PATH)
+disk_cached = diskCache.cached
+scanState = ScanState(STATE_PATH)
@@ -12,6 +12,7 @@ def get_arguments(name, description, version):
     parser.add_argument('-d', '--directory', metavar='directory', dest='directory', help='Directory to scan. Use -r flag to scan entire library.', default=None)
     parser.add_argument('--use_threads', action='store_true', dest='threads', help='Speed up scans with threading', default=False)
     parser.add_argument('--delete_corrupt', action='store_true', dest='deleteCorrupt', help='Remove trailers with corruption and replace', default=False)
+    parser.add_argument('--force', action='store_true', dest='force', help='Rescan directories that already have a trailer from a previous run', default=False)
 
     # Create argument groups
     title_year_group = parser.add_argument_group('Movie Title Year info')
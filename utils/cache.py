@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import functools
+import hashlib
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+
+class DiskCache():
+    '''
+    Small sqlite backed key/value store used to persist lookups between runs
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.enabled = True
+        try:
+            with closing(self._connect()) as db, db:
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, payload BLOB)')
+                # Drop anything that expired since the last run so the file does not grow forever
+                db.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?', (time.time(),))
+        except sqlite3.Error as e:
+            # Lookups still work without the cache, they are just repeated on every run
+            print('Could not open the cache at {} ERROR: {}. Continuing without it.'.format(self.path, e))
+            self.enabled = False
+
+    def _connect(self):
+        # A new connection per call keeps the cache safe to use from executor threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _makeKey(self, *parts):
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            with closing(self._connect()) as db:
+                row = db.execute('SELECT expires, payload FROM cache WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+
+        if not row:
+            return None
+        expires, payload = row
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        try:
+            return pickle.loads(payload)
+        except Exception:
+            # Unreadable entries are treated as a miss and replaced on the next set
+            self.delete(key)
+            return None
+
+    def set(self, key, value, ttl=None):
+        if not self.enabled:
+            return
+        expires = time.time() + ttl if ttl else None
+        try:
+            with closing(self._connect()) as db, db:
+                db.execute('INSERT OR REPLACE INTO cache (key, expires, payload) VALUES (?, ?, ?)',
+                    (key, expires, pickle.dumps(value)))
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key):
+        if not self.enabled:
+            return
+        try:
+            with closing(self._connect()) as db, db:
+                db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error:
+            pass
+
+    def cached(self, ttl=None):
+        '''
+        Decorates a method so its results are stored on disk, keyed by its arguments.
+        Empty results are not stored so failed lookups are retried on the next run.
+        '''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(instance, *args, **kwargs):
+                key = self._makeKey(func.__qualname__, args, sorted(kwargs.items()))
+                result = self.get(key)
+                if result is not None:
+                    return result
+                result = func(instance, *args, **kwargs)
+                if result:
+                    self.set(key, result, ttl)
+                return result
+            return wrapper
+        return decorator
@@ -93,4 +93,11 @@ class Config(object):
         if not self._raw_config is None:
             if 'TRAILERS' in self._raw_config.sections():
                 return self._raw_config['TRAILERS'].get('perferred_source', 'apple').lower()
-        return 'apple'
\ No newline at end of file
+        return 'apple'
+
+    @property
+    def skip_ffprobe(self):
+        if not self._raw_config is None:
+            if 'SCAN' in self._raw_config.sections():
+                return self._raw_config['SCAN'].getboolean('skip_ffprobe', False)
+        return False
@@ -14,6 +14,7 @@ class Logger():
         self._log_to_file = log_to_file
         self._log_path = log_path
         self._quiet = quiet
+        self.loggers = []
 
     def get_null_log(self, name):
         log = logging.getLogger(name)
@@ -40,4 +41,5 @@ class Logger():
             fh.setFormatter(self._format)
             log.addHandler(fh)
 
+        self.loggers.append(log)
         return log
\ No newline at end of file
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+FOUND = 'found'
+DOWNLOADED = 'downloaded'
+MISSING = 'missing'
+ERROR = 'error'
+
+class ScanState():
+    '''
+    Remembers the outcome for each movie directory so finished ones can be skipped on later scans
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            with self._lock, self._db:
+                self._db.execute('PRAGMA journal_mode=WAL')
+                # Older state files only kept the directory mtime, start those over
+                columns = [row[1] for row in self._db.execute('PRAGMA table_info(state)')]
+                if columns and not 'signature' in columns:
+                    self._db.execute('DROP TABLE state')
+                self._db.execute('CREATE TABLE IF NOT EXISTS state (dir TEXT PRIMARY KEY, last_scan REAL, status TEXT, signature TEXT)')
+        except sqlite3.Error as e:
+            # Without the state every directory is simply scanned again
+            print('Could not open the scan state at {} ERROR: {}. Every directory will be rescanned.'.format(self.path, e))
+            self._db = None
+
+    def _hash(self, signature):
+        return hashlib.sha1(repr(signature).encode()).hexdigest()
+
+    def shouldRescan(self, directory, signature):
+        '''
+        signature describes the directory contents, see media.movieFolder.folder_signature
+        '''
+        if self._db is None:
+            return True
+        directory = os.path.abspath(directory)
+
+        try:
+            with self._lock:
+                row = self._db.execute('SELECT status, signature FROM state WHERE dir = ?', (directory,)).fetchone()
+        except sqlite3.Error:
+            return True
+
+        if not row:
+            return True
+        status, lastSignature = row
+        # Directories that changed since they were last handled may have lost their trailer
+        return status in (MISSING, ERROR) or lastSignature != self._hash(signature)
+
+    def setStatus(self, directory, status, signature):
+        if self._db is None:
+            return
+        directory = os.path.abspath(directory)
+
+        try:
+            with self._lock, self._db:
+                self._db.execute('INSERT OR REPLACE INTO state (dir, last_scan, status, signature) VALUES (?, ?, ?, ?)',
+                    (directory, time.time(), status, self._hash(signature)))
+        except sqlite3.Error:
+            pass